@@ -8,6 +8,9 @@ Run this on your server to allow Claude to query your database.
 Requirements:
     pip install flask pymongo
 
+Optional (faster JSON encoding and decoding, response compression):
+    pip install python-bsonjs orjson flask-compress
+
 Usage:
     1. Set environment variables:
        export MONGO_URI="mongodb://localhost:27017"
@@ -20,6 +23,14 @@ Usage:
        Use nginx as reverse proxy with SSL, or:
        pip install pyopenssl
        python3 mongodb_bridge.py --ssl
+    
+    4. Under load, serve with gunicorn instead of Flask's development server:
+       pip install gunicorn
+       gunicorn -k gthread -w $(nproc) --threads 32 --preload --worker-tmp-dir /dev/shm -b 0.0.0.0:80 mongodb_bridge:app
+    
+    5. Or serve via ASGI:
+       pip install a2wsgi uvicorn
+       uvicorn mongodb_bridge:asgi_app --host 0.0.0.0 --port 80 --workers 4
 
 Security:
     - All requests require X-API-Key header
@@ -28,53 +39,148 @@ Security:
 """
 
 import os
+import re
+import atexit
 import sys
 import json
+import base64
+import time
 import secrets
 import argparse
-from datetime import datetime
-from functools import wraps
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from functools import lru_cache, wraps
+from urllib.parse import quote, urlsplit, urlunsplit
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
+import pymongo
 from pymongo import MongoClient
-from pymongo.errors import PyMongoError
-from bson import ObjectId, json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from bson import ObjectId, Regex, Timestamp, json_util, decode as bson_decode
+from bson.codec_options import CodecOptions
 from bson.errors import InvalidId
+from bson.raw_bson import RawBSONDocument
+
+try:
+    import bsonjs
+except ImportError:
+    bsonjs = None
+
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    orjson = None
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
 
 app = Flask(__name__)
 
-# Configuration
-MONGO_URI = os.environ.get("MONGO_URI", None)
-API_KEY = os.environ.get("API_KEY", None)
+# HTTP response compression (requires: pip install flask-compress)
+app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+app.config["COMPRESS_MIN_SIZE"] = 1024
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+# Tune brotli for UTF-8 text, since every compressed response is JSON
+app.config["COMPRESS_BR_MODE"] = 1
+app.config["COMPRESS_ALGORITHM_STREAMING"] = ["br", "deflate"]
+app.config["COMPRESS_STREAMS"] = True
+if Compress is not None:
+    Compress(app)
 
-# Interactive configuration if MONGO_URI not set
-if not MONGO_URI:
-    print("\n" + "="*60)
-    print("MongoDB Connection Setup")
-    print("="*60)
-    
-    mongo_host = input("MongoDB host [localhost]: ").strip() or "localhost"
-    mongo_port = input("MongoDB port [27017]: ").strip() or "27017"
-    mongo_user = input("MongoDB username (leave empty if none): ").strip()
-    mongo_pass = ""
-    if mongo_user:
-        mongo_pass = input("MongoDB password: ").strip()
-    mongo_db = input("Authentication database (leave empty for default): ").strip()
-    
-    if mongo_user and mongo_pass:
-        if mongo_db:
-            MONGO_URI = f"mongodb://{mongo_user}:{mongo_pass}@{mongo_host}:{mongo_port}/{mongo_db}"
-        else:
-            MONGO_URI = f"mongodb://{mongo_user}:{mongo_pass}@{mongo_host}:{mongo_port}"
-    else:
-        MONGO_URI = f"mongodb://{mongo_host}:{mongo_port}"
-    
-    print(f"\nUsing MongoDB URI: {MONGO_URI.replace(mongo_pass, '****') if mongo_pass else MONGO_URI}")
-    print("="*60 + "\n")
 
+if orjson is not None:
+    def _orjson_default(o):
+        """Encode types orjson does not handle natively."""
+        if isinstance(o, ObjectId):
+            return str(o)
+        if isinstance(o, bytes):
+            return base64.b64encode(o).decode("ascii")
+        return DefaultJSONProvider.default(o)
+
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson, used by jsonify."""
+        
+        def _encode(self, obj, indent=False, **kwargs):
+            option = orjson.OPT_NON_STR_KEYS
+            if kwargs.get("sort_keys", self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=_orjson_default, option=option)
+        
+        def dumps(self, obj, **kwargs):
+            return self._encode(obj, **kwargs).decode("utf-8")
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+        
+        def response(self, *args, **kwargs):
+            # Hand orjson's bytes to the response as-is, skipping the str round trip
+            obj = self._prepare_response_obj(args, kwargs)
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            return self._app.response_class(self._encode(obj, indent=indent), mimetype=self.mimetype)
+
+
+    app.json = OrjsonProvider(app)
+
+# Configuration (prompts for unset values run only from __main__, see _bootstrap_config)
+MONGO_URI = os.environ.get("MONGO_URI") or "mongodb://localhost:27017"
 # Generate a random API key if not provided
-if not API_KEY:
-    API_KEY = secrets.token_urlsafe(32)
+API_KEY = os.environ.get("API_KEY") or secrets.token_urlsafe(32)
+
+
+def build_mongo_uri(host, port, user="", password="", auth_db=""):
+    """Build a mongodb:// URI, percent-encoding the credentials."""
+    netloc = f"{host}:{port}"
+    if user and password:
+        netloc = f"{quote(user, safe='')}:{quote(password, safe='')}@{netloc}"
+    return urlunsplit(("mongodb", netloc, f"/{auth_db}" if auth_db else "", "", ""))
+
+
+def redact_uri(uri):
+    """Return uri with its password masked, for logging."""
+    parts = urlsplit(uri)
+    if parts.password is None:
+        return uri
+    hosts = parts.netloc.rpartition("@")[2]
+    return urlunsplit(parts._replace(netloc=f"{parts.username}:****@{hosts}"))
+
+
+def uri_credentials(uri):
+    """The "user:password" part of a MongoDB URI, or None if it has none."""
+    return urlsplit(uri).netloc.rpartition("@")[0] or None
+
+
+def env_int(name, default):
+    """Positive integer from the environment, or default (with a warning) if unset or invalid."""
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        print(f"WARNING: {name}={value!r} is not a positive integer, using {default}")
+        return default
+    return number
+
+
+def print_api_key_warning():
+    """Show the generated API key when none was configured."""
     print(f"\n{'='*60}")
     print("WARNING: No API_KEY environment variable set!")
     print(f"Generated temporary API key:\n")
@@ -83,108 +189,638 @@ if not API_KEY:
     print(f"   export API_KEY=\"{API_KEY}\"")
     print(f"{'='*60}\n")
 
+
+def _bootstrap_config():
+    """
+    Interactive configuration when run as a script: prompt for the MongoDB
+    connection if MONGO_URI is not set, and show the generated API key.
+    Never runs on import, so WSGI/ASGI servers don't block on input().
+    """
+    global MONGO_URI, _SHARD_URI_CREDS, _SHARD_URI_AUTH
+    if not os.environ.get("MONGO_URI"):
+        print("\n" + "="*60)
+        print("MongoDB Connection Setup")
+        print("="*60)
+        
+        mongo_host = input("MongoDB host [localhost]: ").strip() or "localhost"
+        mongo_port = input("MongoDB port [27017]: ").strip() or "27017"
+        mongo_user = input("MongoDB username (leave empty if none): ").strip()
+        mongo_pass = ""
+        if mongo_user:
+            mongo_pass = input("MongoDB password: ").strip()
+        mongo_db = input("Authentication database (leave empty for default): ").strip()
+        
+        MONGO_URI = build_mongo_uri(mongo_host, mongo_port, mongo_user, mongo_pass, mongo_db)
+        _SHARD_URI_CREDS, _SHARD_URI_AUTH = _shard_uri_auth(MONGO_URI)
+        build_shard_uri.cache_clear()
+        
+        print(f"\nUsing MongoDB URI: {redact_uri(MONGO_URI)}")
+        print("="*60 + "\n")
+    
+    if not os.environ.get("API_KEY"):
+        print_api_key_warning()
+
+# Wire protocol compressors for MongoDB connections, limited to the libraries installed
+WIRE_COMPRESSORS = ",".join(
+    name for name, module in (("zstd", "zstandard"), ("snappy", "snappy"), ("zlib", "zlib"))
+    if importlib.util.find_spec(module) is not None
+)
+
+def _shard_uri_auth(uri):
+    """URI prefix and query suffix carrying the credentials of uri over to shard URIs."""
+    creds = uri_credentials(uri)
+    if creds:
+        return f"{creds}@", "&authSource=admin"
+    return "", ""
+
+
+# Credentials from MONGO_URI, reused for direct shard connections
+_SHARD_URI_CREDS, _SHARD_URI_AUTH = _shard_uri_auth(MONGO_URI)
+
+
+@lru_cache(maxsize=64)
+def build_shard_uri(host_str):
+    """
+    Build a direct-connection URI for a shard from its config.shards host string
+    (format: "replicaSetName/host1:port,host2:port"), using the first host.
+    The URI only carries the host and credentials, so each shard gets one client;
+    timeouts live in SHARD_CLIENT_OPTIONS or are applied per operation.
+    """
+    hosts = host_str.split("/", 1)[1] if "/" in host_str else host_str
+    first_host = hosts.split(",")[0]
+    return f"mongodb://{_SHARD_URI_CREDS}{first_host}/?directConnection=true{_SHARD_URI_AUTH}"
+
+
+# Optional socket read timeout for MongoDB connections (milliseconds). Unset by
+# default, so long-running queries, aggregations and commands are not cut off.
+MONGO_SOCKET_TIMEOUT_MS = env_int("MONGO_SOCKET_TIMEOUT_MS", None)
+
+# Connection pool settings for the main MongoDB client
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": 100,
+    "minPoolSize": 10,
+    "maxIdleTimeMS": 60000,
+    "waitQueueTimeoutMS": 5000,
+    "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    "appname": "mongodb-http-bridge",
+    "compressors": WIRE_COMPRESSORS
+}
+
 # MongoDB client (lazy connection)
 _client = None
+_client_lock = threading.Lock()
 
 def get_client():
     global _client
     if _client is None:
-        _client = MongoClient(MONGO_URI)
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
     return _client
 
 
-def parse_json_extended(data):
-    """Parse JSON with MongoDB extended JSON support."""
-    return json_util.loads(json.dumps(data))
+# Pool settings for direct shard connections
+SHARD_CLIENT_OPTIONS = {
+    "maxPoolSize": 20,
+    "minPoolSize": 2,
+    "maxIdleTimeMS": 60000,
+    "connectTimeoutMS": 2000,
+    "serverSelectionTimeoutMS": 5000,
+    "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    "heartbeatFrequencyMS": 30000,
+    "retryReads": False,
+    "appname": "mongodb-http-bridge-shard",
+    "compressors": WIRE_COMPRESSORS
+}
+
+# Direct shard connections, one client per shard URI (host and credentials) so its connection pool is reused
+_shard_clients = {}
+_shard_clients_lock = threading.Lock()
+
+# How long the config.shards listing is reused before it is queried again (seconds)
+SHARDS_CACHE_TTL = 60
+_shards_cache = None
+
+
+def get_shard_client(shard_uri):
+    """Return the cached MongoClient for a direct shard connection."""
+    shard_client = _shard_clients.get(shard_uri)
+    if shard_client is None:
+        with _shard_clients_lock:
+            shard_client = _shard_clients.get(shard_uri)
+            if shard_client is None:
+                shard_client = MongoClient(shard_uri, **SHARD_CLIENT_OPTIONS)
+                _shard_clients[shard_uri] = shard_client
+    return shard_client
+
+
+def _reset_clients_after_fork():
+    """
+    Forget clients inherited from the parent process (e.g. gunicorn --preload).
+    pymongo clients are not fork-safe, so each worker opens and warms its own.
+    """
+    global _client, _client_lock, _shard_clients, _shard_clients_lock
+    global _warm_up_started, _warm_up_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _shard_clients = {}
+    _shard_clients_lock = threading.Lock()
+    _warm_up_started = False
+    _warm_up_lock = threading.Lock()
+    start_warm_up()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _close_clients():
+    """Close the cached clients at interpreter exit."""
+    for shard_client in list(_shard_clients.values()):
+        shard_client.close()
+    if _client is not None:
+        _client.close()
+
+
+atexit.register(_close_clients)
+
+
+# Upper bound on the warm-up ping, so an unreachable server can't stall a worker (seconds)
+WARM_UP_TIMEOUT = 2
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up():
+    """Connect to MongoDB ahead of the first queries so the connection pool starts filling."""
+    try:
+        with pymongo.timeout(WARM_UP_TIMEOUT):
+            get_client().admin.command("ping")
+    except PyMongoError as e:
+        app.logger.warning("MongoDB warm-up ping failed: %s", e)
+
+
+def start_warm_up():
+    """
+    Run warm_up() on a background thread, once per process. Called after fork
+    (gunicorn --preload workers) and before the first request otherwise, so
+    each worker warms the pool it actually serves from.
+    """
+    global _warm_up_started
+    if _warm_up_started:
+        return
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    if not os.environ.get("API_KEY") and __name__ != "__main__":
+        print_api_key_warning()
+    threading.Thread(target=warm_up, name="mongo-warm-up", daemon=True).start()
+
+
+app.before_request(start_warm_up)
+
+
+def get_shards(refresh=False):
+    """Return the config.shards documents, cached for SHARDS_CACHE_TTL seconds."""
+    global _shards_cache
+    now = time.monotonic()
+    cached = _shards_cache
+    if cached is not None and not refresh and cached[0] > now:
+        return cached[1]
+    shards = list(get_client()["config"]["shards"].find({}))
+    _shards_cache = (now + SHARDS_CACHE_TTL, shards)
+    return shards
+
+
+# Worker threads for concurrent MongoDB round trips (pymongo releases the GIL during I/O)
+_io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="mongo-io")
+
+# Most _io_pool tasks a single bounded_map call keeps queued or running at once
+IO_REQUEST_CONCURRENCY = 8
+
+# Shard fan-out has its own workers, so health probes never wait behind other requests' I/O
+_shard_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shard-fanout")
+
+# Upper bound on how long a fan-out waits for all shards to answer (seconds)
+SHARD_FANOUT_TIMEOUT = 10
+
+# Server-side limit for ?include_count counts, which also bounds how long the
+# end of a streamed response waits for the count (seconds)
+COUNT_TIMEOUT = 5
+
 
+def bounded_map(fn, items):
+    """
+    Like _io_pool.map, returning a list in item order, but with at most
+    IO_REQUEST_CONCURRENCY tasks of this call in the pool at a time, so one
+    request with many items can't monopolise the workers.
+    """
+    slots = threading.BoundedSemaphore(IO_REQUEST_CONCURRENCY)
+    
+    def run(item):
+        try:
+            return fn(item)
+        finally:
+            slots.release()
+    
+    futures = []
+    for item in items:
+        slots.acquire()
+        futures.append(_io_pool.submit(run, item))
+    return [future.result() for future in futures]
+
+
+def map_shards(fn, shards, on_timeout):
+    """
+    Run fn(shard) for every shard concurrently and return the results in shard order.
+    Shards that have not answered within SHARD_FANOUT_TIMEOUT get on_timeout(shard) instead.
+    """
+    futures = [_shard_pool.submit(fn, shard) for shard in shards]
+    deadline = time.monotonic() + SHARD_FANOUT_TIMEOUT
+    results = []
+    for shard, future in zip(shards, futures):
+        try:
+            results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            # Drop the probe if it never started rather than let it hold a worker later
+            future.cancel()
+            results.append(on_timeout(shard))
+    return results
+
+
+def find_shard(shard_id):
+    """Return the config.shards document for shard_id, or None if it does not exist."""
+    for refresh in (False, True):
+        for shard in get_shards(refresh=refresh):
+            if shard.get("_id") == shard_id:
+                return shard
+    return None
+
+
+def get_request_data():
+    """
+    Parse the request body with MongoDB extended JSON support.
+    The raw body is decoded once, so filters, pipelines and documents arrive as BSON types.
+    With python-bsonjs the body is transcoded straight to a RawBSONDocument, whose
+    nested documents are passed to the server as raw BSON without becoming dicts.
+    libbson reads query operators such as {"$type": 2} as Extended JSON keys and
+    rejects them, so bodies it cannot parse fall back to json_util.
+    """
+    body = request.get_data(cache=False)
+    if not body.strip():
+        return None
+    if bsonjs is not None:
+        try:
+            return RawBSONDocument(bsonjs.loads(body))
+        except ValueError:
+            pass
+    return json_util.loads(body)
+
+
+def plain_format_requested():
+    """
+    Whether the caller asked for plain JSON (?format=plain): ObjectIds as hex strings,
+    datetimes as ISO-8601 and binary as base64 instead of Extended JSON wrappers.
+    Smaller and cheaper to encode, but BSON type information is lost.
+    """
+    return request.args.get("format") == "plain"
+
+
+# Regex option letters for plain output, in the order MongoDB prints them
+REGEX_FLAG_LETTERS = (
+    ("i", re.IGNORECASE), ("l", re.LOCALE), ("m", re.MULTILINE),
+    ("s", re.DOTALL), ("u", re.UNICODE), ("x", re.VERBOSE)
+)
+
+
+def _plain_default(o):
+    """Encode BSON types that plain JSON has no equivalent for."""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, datetime):
+        # BSON datetimes are UTC; pymongo decodes them as naive datetimes
+        return (o if o.tzinfo else o.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(o, bytes):
+        return base64.b64encode(o).decode("ascii")
+    if isinstance(o, RawBSONDocument):
+        return bson_decode(o.raw)
+    if isinstance(o, Mapping):
+        return dict(o)
+    if isinstance(o, Timestamp):
+        return {"t": o.time, "i": o.inc}
+    if isinstance(o, Regex):
+        return {"pattern": o.pattern, "flags": "".join(c for c, flag in REGEX_FLAG_LETTERS if o.flags & flag)}
+    return str(o)
+
+
+def plain_dumps(data):
+    """Serialize data to plain JSON (see plain_format_requested)."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_plain_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC).decode("utf-8")
+    return json.dumps(data, default=_plain_default)
+
+
+def json_response(payload):
+    """Encode a payload containing MongoDB types into a JSON Response in one pass."""
+    body = plain_dumps(payload) if plain_format_requested() else json_util.dumps(payload)
+    return Response(body, mimetype="application/json")
+
+
+# Documents read through this codec stay as BSON bytes until they are encoded
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def raw_collection(collection):
+    """Return the collection yielding RawBSONDocuments when python-bsonjs is available."""
+    if bsonjs is None:
+        return collection
+    return collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+
+
+def serialize_document(doc):
+    """Serialize a single document to an Extended JSON (relaxed mode) string."""
+    if bsonjs is not None and isinstance(doc, RawBSONDocument):
+        return bsonjs.dumps(doc.raw, mode=bsonjs.RELAXED)
+    return json_util.dumps(doc)
+
+
+def serialize_plain_document(doc):
+    """Serialize a single document to a plain JSON string."""
+    if isinstance(doc, RawBSONDocument):
+        doc = bson_decode(doc.raw)
+    return plain_dumps(doc)
+
+
+# Cursor batch size for streamed reads (documents per getMore round trip)
+CURSOR_BATCH_SIZE = 1000
 
-def serialize_response(data):
-    """Serialize MongoDB response to JSON-safe format."""
-    return json.loads(json_util.dumps(data))
+# Streamed output is flushed to the client in chunks of roughly this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# Response envelopes for document endpoints, up to the opening "[" of the documents
+# array; fields are filled with JSON-encoded strings and the documents follow.
+QUERY_TEMPLATE = '{"database": %s, "collection": %s, "documents": ['
+AGGREGATE_TEMPLATE = '{"database": %s, "collection": %s, "results": ['
+INDEXES_TEMPLATE = '{"database": %s, "collection": %s, "indexes": ['
+SHARD_QUERY_TEMPLATE = '{"shard": %s, "database": %s, "collection": %s, "documents": ['
+SHARD_AGGREGATE_TEMPLATE = '{"shard": %s, "database": %s, "collection": %s, "results": ['
+DOCUMENTS_TAIL_TEMPLATE = '], "count": %d}'
+TOTAL_COUNT_TAIL_TEMPLATE = '], "count": %d, "total_count": %s}'
+
+
+def documents_response(template, fields, cursor, total_count=None):
+    """
+    Stream a JSON response: the envelope template filled with fields, then the
+    documents from cursor as they arrive from the driver, then a trailing "count".
+    Peak memory is one cursor batch instead of the whole result set.
+    
+    total_count, if given, is a Future for the number of matching documents;
+    it is written after the documents as "total_count" (null if it failed).
+    """
+    # Fetch the first batch now so query errors are reported before the 200 is sent
+    first = next(cursor, None)
+    head = template % tuple(json.dumps(field) for field in fields)
+    serialize = serialize_plain_document if plain_format_requested() else serialize_document
+    
+    def generate():
+        try:
+            count = 0
+            chunk = [head]
+            size = 0
+            if first is not None:
+                chunk.append(serialize(first))
+                count = 1
+                for doc in cursor:
+                    encoded = serialize(doc)
+                    chunk.append(",")
+                    chunk.append(encoded)
+                    count += 1
+                    size += len(encoded)
+                    if size >= STREAM_CHUNK_SIZE:
+                        yield "".join(chunk)
+                        chunk = []
+                        size = 0
+            if total_count is None:
+                chunk.append(DOCUMENTS_TAIL_TEMPLATE % count)
+            else:
+                try:
+                    total = total_count.result(timeout=COUNT_TIMEOUT)
+                except Exception as e:
+                    # The documents are already sent, so report the count as unknown
+                    app.logger.warning("total_count failed: %r", e)
+                    total = None
+                chunk.append(TOTAL_COUNT_TAIL_TEMPLATE % (count, json.dumps(total)))
+            yield "".join(chunk)
+        finally:
+            cursor.close()
+    
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+_API_KEY_BYTES = API_KEY.encode("utf-8")
+# Fixed error payloads are encoded once; each request still gets its own
+# Response because flask-compress rewrites responses in place
+_UNAUTHORIZED_BODY = b'{"error": "Unauthorized - Invalid or missing API key"}'
+_BODY_REQUIRED_BODY = b'{"error": "Request body required"}'
+_DB_AND_COLL_REQUIRED_BODY = b'{"error": "database and collection are required"}'
+
+
+def static_response(body, status=200):
+    """Wrap a pre-encoded JSON body in a fresh Response."""
+    return Response(body, status, mimetype="application/json")
 
 
 def require_api_key(f):
     """Decorator to require API key authentication."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        provided_key = request.headers.get("X-API-Key")
-        if not provided_key or provided_key != API_KEY:
-            return jsonify({"error": "Unauthorized - Invalid or missing API key"}), 401
+        # Constant-time comparison so the key can't be guessed from response timing
+        provided_key = request.headers.get("X-API-Key", "").encode("utf-8")
+        if not secrets.compare_digest(provided_key, _API_KEY_BYTES):
+            return static_response(_UNAUTHORIZED_BODY, 401)
         return f(*args, **kwargs)
     return decorated
 
 
+# Read-only metadata responses are reused for METADATA_CACHE_TTL seconds
+METADATA_CACHE_TTL = 30
+METADATA_CACHE_SIZE = 256
+_metadata_cache = {}
+_metadata_cache_lock = threading.Lock()
+
+
+def _cache_lookup(cache, key):
+    """Return the body cached under key, or None if it is missing or expired."""
+    cached = cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _cache_store(cache, lock, key, body, ttl, max_size):
+    """Cache body for ttl seconds, dropping expired and then oldest entries when full."""
+    now = time.monotonic()
+    with lock:
+        if len(cache) >= max_size:
+            for stale in [k for k, v in cache.items() if v[0] <= now]:
+                del cache[stale]
+            if len(cache) >= max_size:
+                del cache[next(iter(cache))]
+        cache[key] = (now + ttl, body)
+
+
+def cache_metadata(f):
+    """
+    Decorator caching successful responses of a read-only metadata endpoint,
+    keyed by path and query string. "Cache-Control: no-cache" forces a refresh.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = (request.path, request.query_string)
+        if "no-cache" not in request.headers.get("Cache-Control", ""):
+            body = _cache_lookup(_metadata_cache, key)
+            if body is not None:
+                return static_response(body)
+        
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            _cache_store(_metadata_cache, _metadata_cache_lock, key, response.get_data(),
+                         METADATA_CACHE_TTL, METADATA_CACHE_SIZE)
+        return response
+    return decorated
+
+
+_INDEX_BODY = json.dumps({
+    "service": "MongoDB HTTP Bridge",
+    "status": "running",
+    "auth_required": True,
+    "endpoints": [
+        "GET  /databases",
+        "GET  /databases/available  (shard-aware)",
+        "GET  /databases/<db>/collections  (?stats=true for counts and sizes)",
+        "GET  /databases/<db>/collections/available  (shard-aware)",
+        "GET  /shards  (list shards and status)",
+        "POST /query",
+        "POST /aggregate",
+        "POST /insert",
+        "POST /update",
+        "POST /delete",
+        "POST /command",
+        "GET  /collection/<db>/<collection>/count",
+        "GET  /collection/<db>/<collection>/indexes",
+        "POST /shard/<id>/query  (shard-aware)",
+        "POST /shard/<id>/aggregate  (shard-aware)",
+        "POST /shard/<id>/command  (shard-aware)",
+        "GET  /shard/<id>/collection/<db>/<coll>/count  (shard-aware)",
+        "GET  /shard/<id>/databases  (shard-aware)",
+        "GET  /shard/<id>/databases/<db>/collections  (shard-aware, ?stats=true for counts and sizes)"
+    ]
+}).encode("utf-8")
+
+
 @app.route("/", methods=["GET"])
 def index():
     """Health check endpoint."""
-    return jsonify({
-        "service": "MongoDB HTTP Bridge",
-        "status": "running",
-        "auth_required": True,
-        "endpoints": [
-            "GET  /databases",
-            "GET  /databases/available  (shard-aware)",
-            "GET  /databases/<db>/collections",
-            "GET  /databases/<db>/collections/available  (shard-aware)",
-            "GET  /shards  (list shards and status)",
-            "POST /query",
-            "POST /aggregate",
-            "POST /insert",
-            "POST /update",
-            "POST /delete",
-            "POST /command",
-            "GET  /collection/<db>/<collection>/count",
-            "GET  /collection/<db>/<collection>/indexes",
-            "POST /shard/<id>/query  (shard-aware)",
-            "POST /shard/<id>/aggregate  (shard-aware)",
-            "POST /shard/<id>/command  (shard-aware)",
-            "GET  /shard/<id>/collection/<db>/<coll>/count  (shard-aware)",
-            "GET  /shard/<id>/databases  (shard-aware)",
-            "GET  /shard/<id>/databases/<db>/collections  (shard-aware)"
-        ]
-    })
+    return static_response(_INDEX_BODY)
 
 
 @app.route("/databases", methods=["GET"])
 @require_api_key
+@cache_metadata
 def list_databases():
     """List all databases."""
     try:
         client = get_client()
-        databases = []
-        for db_info in client.list_databases():
-            databases.append({
-                "name": db_info["name"],
-                "sizeOnDisk": db_info.get("sizeOnDisk"),
-                "empty": db_info.get("empty", False)
-            })
-        return jsonify({"databases": databases})
+        result = client.admin.command("listDatabases")
+        return jsonify({"databases": result["databases"]})
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
 
 
+def query_flag(name):
+    """Whether an opt-in query-string flag is set (?stats=true, ?stats=1 or ?stats=yes)."""
+    return request.args.get(name, "false").lower() in ("true", "1", "yes")
+
+
+COLL_STATS_PIPELINE = [{"$collStats": {"storageStats": {}}}]
+
+# Server error codes already reported by _collection_stats, so each is logged once
+_stats_failure_codes = set()
+_stats_failure_codes_lock = threading.Lock()
+
+
+def _collection_stats(database, coll_name):
+    """
+    (count, size) of a collection via the $collStats stage (the collStats
+    command is deprecated). Through mongos there is one result per shard, so
+    they are summed. Returns None if the server rejects the stage, e.g. for
+    lack of privileges; connection errors propagate.
+    """
+    count = size = 0
+    try:
+        for doc in database[coll_name].aggregate(COLL_STATS_PIPELINE):
+            storage = doc.get("storageStats", {})
+            count += storage.get("count", 0)
+            size += storage.get("size", 0)
+    except OperationFailure as e:
+        with _stats_failure_codes_lock:
+            first_failure = e.code not in _stats_failure_codes
+            _stats_failure_codes.add(e.code)
+        if first_failure:
+            app.logger.warning("$collStats failed on %s.%s: %s", database.name, coll_name, e)
+        return None
+    return int(count), int(size)
+
+
+def _collections_with_stats(database):
+    """
+    Pair each listCollections entry with its _collection_stats, fetched
+    concurrently through bounded_map. Views and other non-collection types
+    get None without a round-trip.
+    """
+    infos = list(database.list_collections())
+    
+    def stats(info):
+        if info.get("type", "collection") != "collection":
+            return None
+        return _collection_stats(database, info["name"])
+    
+    return zip(infos, bounded_map(stats, infos))
+
+
 @app.route("/databases/<db>/collections", methods=["GET"])
 @require_api_key
+@cache_metadata
 def list_collections(db):
-    """List all collections in a database."""
+    """
+    List all collections in a database.
+    
+    Optional query parameters:
+    - stats=true: include type, count, size and avgObjSize (one $collStats per collection, none for views)
+    """
     try:
         client = get_client()
         database = client[db]
-        collections = database.list_collection_names()
         
-        # Get collection stats
+        if not query_flag("stats"):
+            collections = database.list_collection_names()
+            return jsonify({"database": db, "collections": [{"name": name} for name in collections]})
+        
         collection_info = []
-        for coll_name in collections:
-            try:
-                stats = database.command("collStats", coll_name)
-                collection_info.append({
-                    "name": coll_name,
-                    "count": stats.get("count", 0),
-                    "size": stats.get("size", 0),
-                    "avgObjSize": stats.get("avgObjSize", 0)
-                })
-            except:
-                collection_info.append({"name": coll_name})
+        for info, stats in _collections_with_stats(database):
+            coll_type = info.get("type", "collection")
+            if stats is None:
+                collection_info.append({"name": info["name"], "type": coll_type})
+                continue
+            count, size = stats
+            collection_info.append({
+                "name": info["name"],
+                "type": coll_type,
+                "count": count,
+                "size": size,
+                "avgObjSize": size // count if count else 0
+            })
         
         return jsonify({"database": db, "collections": collection_info})
     except PyMongoError as e:
@@ -207,30 +843,35 @@ def query():
         "limit": 100,                       // optional, default 100
         "skip": 0                           // optional
     }
+    
+    Pass ?include_count=true to also get "total_count", the number of
+    documents matching the filter regardless of skip/limit. It is counted
+    on the server while the documents stream, and is null if the count
+    takes longer than COUNT_TIMEOUT.
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
         
         client = get_client()
-        collection = client[db_name][coll_name]
+        collection = raw_collection(client[db_name][coll_name])
         
         # Parse query parameters
-        filter_query = parse_json_extended(data.get("filter", {}))
+        filter_query = data.get("filter", {})
         projection = data.get("projection")
         sort = data.get("sort")
         limit = data.get("limit", 100)
         skip = data.get("skip", 0)
         
         # Build cursor
-        cursor = collection.find(filter_query, projection)
+        cursor = collection.find(filter_query, projection).batch_size(CURSOR_BATCH_SIZE)
         
         if sort:
             cursor = cursor.sort(sort)
@@ -239,15 +880,12 @@ def query():
         if limit:
             cursor = cursor.limit(limit)
         
-        # Execute and serialize
-        documents = list(cursor)
+        total_count = None
+        if query_flag("include_count"):
+            total_count = _io_pool.submit(collection.count_documents, filter_query, maxTimeMS=COUNT_TIMEOUT * 1000)
         
-        return jsonify({
-            "database": db_name,
-            "collection": coll_name,
-            "count": len(documents),
-            "documents": serialize_response(documents)
-        })
+        # Execute and stream
+        return documents_response(QUERY_TEMPLATE, (db_name, coll_name), cursor, total_count)
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -271,32 +909,24 @@ def aggregate():
     }
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
         pipeline = data.get("pipeline", [])
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
         
         client = get_client()
-        collection = client[db_name][coll_name]
-        
-        # Parse pipeline with extended JSON
-        pipeline = parse_json_extended(pipeline)
+        collection = raw_collection(client[db_name][coll_name])
         
         # Execute aggregation
-        results = list(collection.aggregate(pipeline))
+        cursor = collection.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
         
-        return jsonify({
-            "database": db_name,
-            "collection": coll_name,
-            "count": len(results),
-            "results": serialize_response(results)
-        })
+        return documents_response(AGGREGATE_TEMPLATE, (db_name, coll_name), cursor)
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -318,9 +948,9 @@ def insert():
     }
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
@@ -334,18 +964,19 @@ def insert():
         collection = client[db_name][coll_name]
         
         # Handle single document or list
-        if isinstance(documents, dict):
+        if isinstance(documents, Mapping):
             documents = [documents]
         
-        documents = parse_json_extended(documents)
+        # pymongo only assigns (and reports) _id for mutable documents
+        documents = [doc if isinstance(doc, dict) else dict(doc) for doc in documents]
         
         result = collection.insert_many(documents, ordered=ordered)
         
-        return jsonify({
+        return json_response({
             "database": db_name,
             "collection": coll_name,
             "inserted_count": len(result.inserted_ids),
-            "inserted_ids": serialize_response(result.inserted_ids)
+            "inserted_ids": result.inserted_ids
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -370,9 +1001,9 @@ def update():
     }
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
@@ -387,20 +1018,17 @@ def update():
         client = get_client()
         collection = client[db_name][coll_name]
         
-        filter_query = parse_json_extended(filter_query)
-        update_doc = parse_json_extended(update_doc)
-        
         if many:
             result = collection.update_many(filter_query, update_doc, upsert=upsert)
         else:
             result = collection.update_one(filter_query, update_doc, upsert=upsert)
         
-        return jsonify({
+        return json_response({
             "database": db_name,
             "collection": coll_name,
             "matched_count": result.matched_count,
             "modified_count": result.modified_count,
-            "upserted_id": serialize_response(result.upserted_id) if result.upserted_id else None
+            "upserted_id": result.upserted_id
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -423,9 +1051,9 @@ def delete():
     }
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
@@ -433,13 +1061,11 @@ def delete():
         many = data.get("many", False)
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
         
         client = get_client()
         collection = client[db_name][coll_name]
         
-        filter_query = parse_json_extended(filter_query)
-        
         if many:
             result = collection.delete_many(filter_query)
         else:
@@ -469,9 +1095,9 @@ def run_command():
     }
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database", "admin")
         command = data.get("command")
@@ -479,15 +1105,18 @@ def run_command():
         if not command:
             return jsonify({"error": "command is required"}), 400
         
+        if isinstance(command, RawBSONDocument):
+            # pymongo adds options to the command document in place; RawBSONDocument is read-only
+            command = bson_decode(command.raw)
+        
         client = get_client()
         database = client[db_name]
         
-        command = parse_json_extended(command)
         result = database.command(command)
         
-        return jsonify({
+        return json_response({
             "database": db_name,
-            "result": serialize_response(result)
+            "result": result
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -514,86 +1143,76 @@ def count_documents(db, collection):
 
 @app.route("/collection/<db>/<collection>/indexes", methods=["GET"])
 @require_api_key
+@cache_metadata
 def list_indexes(db, collection):
     """List indexes for a collection."""
     try:
         client = get_client()
         coll = client[db][collection]
-        indexes = list(coll.list_indexes())
-        return jsonify({
-            "database": db,
-            "collection": collection,
-            "indexes": serialize_response(indexes)
-        })
+        return documents_response(INDEXES_TEMPLATE, (db, collection), coll.list_indexes())
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
 
 
+def _shard_status(shard, error=None):
+    """Return the /shards status entry for a shard, offline until probed."""
+    return {
+        "id": shard.get("_id"),
+        "host": shard.get("host"),
+        "state": shard.get("state", 1),
+        "online": False,
+        "error": error
+    }
+
+
+# Upper bound on a shard health-check ping, including server selection (seconds)
+SHARD_PROBE_TIMEOUT = 3
+
+
+def _probe_shard(shard):
+    """Ping a shard directly and return its status entry for /shards."""
+    shard_info = _shard_status(shard)
+    
+    # Try to connect to this shard directly
+    try:
+        shard_uri = build_shard_uri(shard.get("host", ""))
+        
+        # Test connection
+        with pymongo.timeout(SHARD_PROBE_TIMEOUT):
+            get_shard_client(shard_uri).admin.command("ping")
+        shard_info["online"] = True
+        
+    except Exception as e:
+        shard_info["online"] = False
+        shard_info["error"] = str(e)
+    
+    return shard_info
+
+
+def probe_shards(shards):
+    """Ping every shard concurrently, returning their /shards status entries in order."""
+    return map_shards(_probe_shard, shards, lambda shard: _shard_status(shard, "Timed out waiting for shard"))
+
+
 @app.route("/shards", methods=["GET"])
 @require_api_key
+@cache_metadata
 def list_shards():
     """
     List all shards and their status.
     Queries config.shards and tests connectivity to each shard.
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Get shard information from config database
-        shards_collection = config_db["shards"]
-        shards = list(shards_collection.find({}))
-        
-        shard_status = []
-        for shard in shards:
-            shard_info = {
-                "id": shard.get("_id"),
-                "host": shard.get("host"),
-                "state": shard.get("state", 1),
-                "online": False,
-                "error": None
-            }
-            
-            # Try to connect to this shard directly
-            try:
-                # Parse the shard host string (format: "replicaSetName/host1:port,host2:port")
-                host_str = shard.get("host", "")
-                if "/" in host_str:
-                    rs_name, hosts = host_str.split("/", 1)
-                else:
-                    hosts = host_str
-                
-                # Get first host for testing
-                first_host = hosts.split(",")[0]
-                
-                # Build connection string for this shard
-                # Extract credentials from main URI if available
-                main_uri = MONGO_URI
-                shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000"
-                
-                # Add auth if present in main URI
-                if "@" in main_uri:
-                    # Extract credentials
-                    creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-                    shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000&authSource=admin"
-                
-                # Test connection
-                test_client = MongoClient(shard_uri)
-                test_client.admin.command("ping")
-                shard_info["online"] = True
-                test_client.close()
-                
-            except Exception as e:
-                shard_info["online"] = False
-                shard_info["error"] = str(e)
-            
-            shard_status.append(shard_info)
+        shards = get_shards()
         
-        return jsonify({
+        shard_status = probe_shards(shards)
+        
+        return json_response({
             "total_shards": len(shard_status),
             "online_shards": sum(1 for s in shard_status if s["online"]),
             "offline_shards": sum(1 for s in shard_status if not s["online"]),
-            "shards": serialize_response(shard_status)
+            "shards": shard_status
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -605,82 +1224,49 @@ def list_shards():
 @require_api_key
 def list_available_databases():
     """
-    List databases from online shards only.
-    Skips unavailable shards instead of failing.
+    List databases with their availability, skipping unavailable shards instead of failing.
+    Database placement comes from config.databases (each database's primary shard);
+    shards are only pinged to check which are online.
+    
+    A database whose primary shard is offline is still listed, with
+    "available": false. Its sharded collections may still be readable from
+    other shards (see /databases/<db>/collections/available).
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Get shard information
-        shards = list(config_db["shards"].find({}))
-        
-        all_databases = {}
-        shard_results = []
-        
-        for shard in shards:
-            shard_id = shard.get("_id")
-            host_str = shard.get("host", "")
-            
-            shard_result = {
-                "shard_id": shard_id,
-                "online": False,
+        shards = get_shards()
+        databases = list(get_client()["config"]["databases"].find({}, {"_id": 1, "primary": 1}))
+        
+        shard_results = {}
+        for status in probe_shards(shards):
+            shard_results[status["id"]] = {
+                "shard_id": status["id"],
+                "online": status["online"],
                 "databases": [],
-                "error": None
+                "error": status["error"]
             }
-            
-            try:
-                # Parse host string
-                if "/" in host_str:
-                    rs_name, hosts = host_str.split("/", 1)
-                else:
-                    hosts = host_str
-                
-                first_host = hosts.split(",")[0]
-                
-                # Build shard connection string
-                main_uri = MONGO_URI
-                shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000"
-                
-                if "@" in main_uri:
-                    creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-                    shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000&authSource=admin"
-                
-                # Connect and list databases
-                shard_client = MongoClient(shard_uri)
-                dbs = shard_client.list_database_names()
-                
-                shard_result["online"] = True
-                shard_result["databases"] = dbs
-                
-                # Merge into all_databases
-                for db_name in dbs:
-                    if db_name not in all_databases:
-                        all_databases[db_name] = {"name": db_name, "shards": []}
-                    all_databases[db_name]["shards"].append(shard_id)
-                
-                shard_client.close()
-                
-            except Exception as e:
-                shard_result["online"] = False
-                shard_result["error"] = str(e)
-            
-            shard_results.append(shard_result)
+        
+        # A database is available when its primary shard is online
+        all_databases = {}
+        for db_info in databases:
+            db_name = db_info["_id"]
+            primary = db_info.get("primary")
+            shard_result = shard_results.get(primary)
+            available = shard_result is not None and shard_result["online"]
+            if available:
+                shard_result["databases"].append(db_name)
+            all_databases[db_name] = {"name": db_name, "shards": [primary], "available": available}
         
         # Also get databases from config server
-        try:
-            config_dbs = ["admin", "config", "local"]
-            for db_name in config_dbs:
-                if db_name not in all_databases:
-                    all_databases[db_name] = {"name": db_name, "shards": ["config"]}
-        except:
-            pass
+        for db_name in ["admin", "config", "local"]:
+            if db_name not in all_databases:
+                all_databases[db_name] = {"name": db_name, "shards": ["config"], "available": True}
         
         return jsonify({
             "total_shards": len(shards),
-            "online_shards": sum(1 for s in shard_results if s["online"]),
+            "online_shards": sum(1 for s in shard_results.values() if s["online"]),
             "databases": list(all_databases.values()),
-            "shard_details": shard_results
+            "shard_details": list(shard_results.values())
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -692,70 +1278,80 @@ def list_available_databases():
 @require_api_key
 def list_available_collections(db):
     """
-    List collections in a database from online shards only.
+    List collections in a database with their availability, skipping unavailable shards.
+    Sharded collections come from config.collections and are placed on the shards
+    holding their chunks; unsharded collections are listed from the database's
+    primary shard when it is online.
+    
+    A sharded collection with chunks on an offline shard is still listed, with
+    "available": false; documents on its online shards can still be queried.
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Get shard information
-        shards = list(config_db["shards"].find({}))
-        
-        all_collections = set()
-        shard_results = []
-        
-        for shard in shards:
-            shard_id = shard.get("_id")
-            host_str = shard.get("host", "")
-            
+        shards = get_shards()
+        config_db = get_client()["config"]
+        db_info = config_db["databases"].find_one({"_id": db}, {"primary": 1}) or {}
+        primary = db_info.get("primary")
+        sharded = list(config_db["collections"].find(
+            {"_id": {"$regex": f"^{re.escape(db)}\\."}, "dropped": {"$ne": True}},
+            {"_id": 1, "uuid": 1}
+        ))
+        
+        # Chunks reference their collection by uuid on MongoDB 5.0+ and by namespace before
+        names = {}
+        for coll in sharded:
+            names[coll["_id"]] = coll["_id"][len(db) + 1:]
+            if "uuid" in coll:
+                names[coll["uuid"]] = names[coll["_id"]]
+        placement = {name: set() for name in names.values()}
+        if sharded:
+            chunk_shards = config_db["chunks"].aggregate([
+                {"$match": {"$or": [
+                    {"ns": {"$in": [coll["_id"] for coll in sharded]}},
+                    {"uuid": {"$in": [coll["uuid"] for coll in sharded if "uuid" in coll]}}
+                ]}},
+                {"$group": {"_id": {"$ifNull": ["$uuid", "$ns"]}, "shards": {"$addToSet": "$shard"}}}
+            ])
+            for group in chunk_shards:
+                if group["_id"] in names:
+                    placement[names[group["_id"]]].update(group["shards"])
+        
+        shard_results = {}
+        for shard, status in zip(shards, probe_shards(shards)):
             shard_result = {
-                "shard_id": shard_id,
-                "online": False,
+                "shard_id": status["id"],
+                "online": status["online"],
                 "collections": [],
-                "error": None
+                "error": status["error"]
             }
-            
-            try:
-                if "/" in host_str:
-                    rs_name, hosts = host_str.split("/", 1)
-                else:
-                    hosts = host_str
-                
-                first_host = hosts.split(",")[0]
-                
-                main_uri = MONGO_URI
-                shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000"
-                
-                if "@" in main_uri:
-                    creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-                    shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=3000&authSource=admin"
-                
-                shard_client = MongoClient(shard_uri)
-                
-                # Check if database exists on this shard
-                if db in shard_client.list_database_names():
-                    collections = shard_client[db].list_collection_names()
-                    shard_result["online"] = True
-                    shard_result["collections"] = collections
-                    all_collections.update(collections)
-                else:
-                    shard_result["online"] = True
-                    shard_result["collections"] = []
-                
-                shard_client.close()
-                
-            except Exception as e:
-                shard_result["online"] = False
-                shard_result["error"] = str(e)
-            
-            shard_results.append(shard_result)
+            if status["online"] and status["id"] == primary:
+                try:
+                    shard_client = get_shard_client(build_shard_uri(shard.get("host", "")))
+                    shard_result["collections"] = shard_client[db].list_collection_names()
+                    for name in shard_result["collections"]:
+                        placement.setdefault(name, set())
+                except Exception as e:
+                    shard_result["online"] = False
+                    shard_result["error"] = str(e)
+            shard_results[status["id"]] = shard_result
+        
+        # A collection is available when every shard holding its data is online
+        all_collections = []
+        for name in sorted(placement):
+            holders = sorted(placement[name] or [primary])
+            online = [shard_id for shard_id in holders
+                      if shard_id in shard_results and shard_results[shard_id]["online"]]
+            for shard_id in online:
+                if name not in shard_results[shard_id]["collections"]:
+                    shard_results[shard_id]["collections"].append(name)
+            all_collections.append({"name": name, "shards": holders, "available": len(online) == len(holders)})
         
         return jsonify({
             "database": db,
-            "collections": sorted(list(all_collections)),
+            "collections": all_collections,
             "total_shards": len(shards),
-            "online_shards": sum(1 for s in shard_results if s["online"]),
-            "shard_details": shard_results
+            "online_shards": sum(1 for s in shard_results.values() if s["online"]),
+            "shard_details": list(shard_results.values())
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -782,57 +1378,38 @@ def query_shard(shard_id):
     }
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Find the shard
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
-        
-        # Parse host string
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        # Build shard connection string
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
         # Connect to shard directly
-        shard_client = MongoClient(shard_uri)
+        shard_client = get_shard_client(shard_uri)
         
         # Get request data
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
         
-        collection = shard_client[db_name][coll_name]
+        collection = raw_collection(shard_client[db_name][coll_name])
         
         # Parse query parameters
-        filter_query = parse_json_extended(data.get("filter", {}))
+        filter_query = data.get("filter", {})
         projection = data.get("projection")
         sort = data.get("sort")
         limit = data.get("limit", 100)
         skip = data.get("skip", 0)
         
         # Build cursor
-        cursor = collection.find(filter_query, projection)
+        cursor = collection.find(filter_query, projection).batch_size(CURSOR_BATCH_SIZE)
         
         if sort:
             cursor = cursor.sort(sort)
@@ -841,17 +1418,8 @@ def query_shard(shard_id):
         if limit:
             cursor = cursor.limit(limit)
         
-        # Execute and serialize
-        documents = list(cursor)
-        shard_client.close()
-        
-        return jsonify({
-            "shard": shard_id,
-            "database": db_name,
-            "collection": coll_name,
-            "count": len(documents),
-            "documents": serialize_response(documents)
-        })
+        # Execute and stream
+        return documents_response(SHARD_QUERY_TEMPLATE, (shard_id, db_name, coll_name), cursor)
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -863,44 +1431,18 @@ def query_shard(shard_id):
 def list_shard_databases(shard_id):
     """List databases on a specific shard."""
     try:
-        client = get_client()
-        config_db = client["config"]
-        
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
-        
-        shard_client = MongoClient(shard_uri)
-        
-        databases = []
-        for db_info in shard_client.list_databases():
-            databases.append({
-                "name": db_info["name"],
-                "sizeOnDisk": db_info.get("sizeOnDisk"),
-                "empty": db_info.get("empty", False)
-            })
-        
-        shard_client.close()
+        shard_client = get_shard_client(shard_uri)
+        result = shard_client.admin.command("listDatabases")
         
         return jsonify({
             "shard": shard_id,
-            "databases": databases
+            "databases": result["databases"]
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -911,47 +1453,39 @@ def list_shard_databases(shard_id):
 @app.route("/shard/<shard_id>/databases/<db>/collections", methods=["GET"])
 @require_api_key
 def list_shard_collections(shard_id, db):
-    """List collections in a database on a specific shard."""
+    """
+    List collections in a database on a specific shard.
+    
+    Optional query parameters:
+    - stats=true: include type, count and size (one $collStats per collection, none for views)
+    """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
-        
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
-        shard_client = MongoClient(shard_uri)
+        shard_client = get_shard_client(shard_uri)
         database = shard_client[db]
         
-        collections = []
-        for coll_name in database.list_collection_names():
-            try:
-                stats = database.command("collStats", coll_name)
-                collections.append({
-                    "name": coll_name,
-                    "count": stats.get("count", 0),
-                    "size": stats.get("size", 0)
-                })
-            except:
-                collections.append({"name": coll_name})
+        if not query_flag("stats"):
+            collections = [{"name": name} for name in database.list_collection_names()]
+            return jsonify({"shard": shard_id, "database": db, "collections": collections})
         
-        shard_client.close()
+        collections = []
+        for info, stats in _collections_with_stats(database):
+            coll_type = info.get("type", "collection")
+            if stats is None:
+                collections.append({"name": info["name"], "type": coll_type})
+                continue
+            count, size = stats
+            collections.append({
+                "name": info["name"],
+                "type": coll_type,
+                "count": count,
+                "size": size
+            })
         
         return jsonify({
             "shard": shard_id,
@@ -964,6 +1498,17 @@ def list_shard_collections(shard_id, db):
         return jsonify({"error": f"Error: {str(e)}"}), 400
 
 
+# Upper bound on /sample "size"
+MAX_SAMPLE_SIZE = 10000
+_INVALID_SAMPLE_SIZE_BODY = json.dumps({"error": f"size must be an integer from 1 to {MAX_SAMPLE_SIZE}"}).encode("utf-8")
+
+# /sample?cache=true responses are reused for SAMPLE_CACHE_TTL seconds
+SAMPLE_CACHE_TTL = 10
+SAMPLE_CACHE_SIZE = 256
+_sample_cache = {}
+_sample_cache_lock = threading.Lock()
+
+
 @app.route("/sample", methods=["POST"])
 @require_api_key  
 def sample():
@@ -974,34 +1519,52 @@ def sample():
     {
         "database": "mydb",
         "collection": "mycollection",
-        "size": 5  // optional, default 5
+        "size": 5,                          // optional, default 5, integer from 1 to 10000
+        "projection": {"field": 1}          // optional
     }
+    
+    $sample is random, so responses are only cached when asked for with
+    ?cache=true; identical requests within SAMPLE_CACHE_TTL seconds then
+    get the same documents.
     """
     try:
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
         size = data.get("size", 5)
+        projection = data.get("projection")
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
+        if not isinstance(size, int) or isinstance(size, bool) or not 1 <= size <= MAX_SAMPLE_SIZE:
+            return static_response(_INVALID_SAMPLE_SIZE_BODY, 400)
+        
+        use_cache = query_flag("cache")
+        if use_cache:
+            cache_key = (db_name, coll_name, size, json_util.dumps(projection), plain_format_requested())
+            body = _cache_lookup(_sample_cache, cache_key)
+            if body is not None:
+                return static_response(body)
         
         client = get_client()
-        collection = client[db_name][coll_name]
+        collection = raw_collection(client[db_name][coll_name])
         
         # Use $sample aggregation
         pipeline = [{"$sample": {"size": size}}]
-        results = list(collection.aggregate(pipeline))
-        
-        return jsonify({
-            "database": db_name,
-            "collection": coll_name,
-            "count": len(results),
-            "documents": serialize_response(results)
-        })
+        if projection:
+            pipeline.append({"$project": projection})
+        # Samples up to CURSOR_BATCH_SIZE arrive in the first batch, with no getMore
+        cursor = collection.aggregate(pipeline, batchSize=min(size, CURSOR_BATCH_SIZE))
+        
+        # Stream results
+        response = documents_response(QUERY_TEMPLATE, (db_name, coll_name), cursor)
+        if use_cache:
+            _cache_store(_sample_cache, _sample_cache_lock, cache_key, response.get_data(),
+                         SAMPLE_CACHE_TTL, SAMPLE_CACHE_SIZE)
+        return response
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -1029,63 +1592,36 @@ def aggregate_shard(shard_id):
     }
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Find the shard
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
-        
-        # Parse host string
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        # Build shard connection string
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
         # Connect to shard directly
-        shard_client = MongoClient(shard_uri)
+        shard_client = get_shard_client(shard_uri)
         
         # Get request data
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         coll_name = data.get("collection")
         pipeline = data.get("pipeline", [])
         
         if not db_name or not coll_name:
-            return jsonify({"error": "database and collection are required"}), 400
+            return static_response(_DB_AND_COLL_REQUIRED_BODY, 400)
         
         if not pipeline:
             return jsonify({"error": "pipeline is required"}), 400
         
-        collection = shard_client[db_name][coll_name]
+        collection = raw_collection(shard_client[db_name][coll_name])
         
         # Execute aggregation
-        results = list(collection.aggregate(pipeline))
-        shard_client.close()
-        
-        return jsonify({
-            "shard": shard_id,
-            "database": db_name,
-            "collection": coll_name,
-            "count": len(results),
-            "results": serialize_response(results)
-        })
+        cursor = collection.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+        return documents_response(SHARD_AGGREGATE_TEMPLATE, (shard_id, db_name, coll_name), cursor)
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
@@ -1111,39 +1647,20 @@ def command_shard(shard_id):
     - collStats: {"collStats": "collection"}
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Find the shard
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
-        
-        # Parse host string
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        # Build shard connection string
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
         # Connect to shard directly
-        shard_client = MongoClient(shard_uri)
+        shard_client = get_shard_client(shard_uri)
         
         # Get request data
-        data = request.get_json()
+        data = get_request_data()
         if not data:
-            return jsonify({"error": "Request body required"}), 400
+            return static_response(_BODY_REQUIRED_BODY, 400)
         
         db_name = data.get("database")
         command = data.get("command")
@@ -1151,16 +1668,19 @@ def command_shard(shard_id):
         if not db_name or not command:
             return jsonify({"error": "database and command are required"}), 400
         
+        if isinstance(command, RawBSONDocument):
+            # pymongo adds options to the command document in place; RawBSONDocument is read-only
+            command = bson_decode(command.raw)
+        
         database = shard_client[db_name]
         
         # Execute command
         result = database.command(command)
-        shard_client.close()
         
-        return jsonify({
+        return json_response({
             "shard": shard_id,
             "database": db_name,
-            "result": serialize_response(result)
+            "result": result
         })
     except PyMongoError as e:
         return jsonify({"error": str(e)}), 500
@@ -1180,34 +1700,15 @@ def count_shard(shard_id, db, collection):
     Example: /shard/rs_usa01/collection/Fermenter/logs/count?filter={"Info.level":"Error"}
     """
     try:
-        client = get_client()
-        config_db = client["config"]
-        
         # Find the shard
-        shard = config_db["shards"].find_one({"_id": shard_id})
+        shard = find_shard(shard_id)
         if not shard:
             return jsonify({"error": f"Shard '{shard_id}' not found"}), 404
         
-        host_str = shard.get("host", "")
-        
-        # Parse host string
-        if "/" in host_str:
-            rs_name, hosts = host_str.split("/", 1)
-        else:
-            hosts = host_str
-        
-        first_host = hosts.split(",")[0]
-        
-        # Build shard connection string
-        main_uri = MONGO_URI
-        shard_uri = f"mongodb://{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000"
-        
-        if "@" in main_uri:
-            creds_part = main_uri.split("@")[0].replace("mongodb://", "")
-            shard_uri = f"mongodb://{creds_part}@{first_host}/?directConnection=true&serverSelectionTimeoutMS=5000&authSource=admin"
+        shard_uri = build_shard_uri(shard.get("host", ""))
         
         # Connect to shard directly
-        shard_client = MongoClient(shard_uri)
+        shard_client = get_shard_client(shard_uri)
         
         coll = shard_client[db][collection]
         
@@ -1220,7 +1721,6 @@ def count_shard(shard_id, db, collection):
         
         # Get count
         count = coll.count_documents(filter_query)
-        shard_client.close()
         
         return jsonify({
             "shard": shard_id,
@@ -1234,6 +1734,12 @@ def count_shard(shard_id, db, collection):
     except Exception as e:
         return jsonify({"error": f"Count error: {str(e)}"}), 400
 
+# ASGI entrypoint: uvicorn mongodb_bridge:asgi_app (requires: pip install a2wsgi uvicorn)
+# Handlers run on a thread pool, so blocking pymongo calls overlap across requests.
+# Keep ASGI_WORKER_THREADS at or below maxPoolSize so handlers don't queue for connections.
+ASGI_WORKER_THREADS = env_int("ASGI_WORKER_THREADS", 32)
+asgi_app = WSGIMiddleware(app, workers=ASGI_WORKER_THREADS) if WSGIMiddleware is not None else None
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="MongoDB HTTP Bridge")
     parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
@@ -1243,7 +1749,9 @@ if __name__ == "__main__":
     parser.add_argument("--key", default="key.pem", help="SSL key file")
     args = parser.parse_args()
     
-    print(f"\nMongoDB URI: {MONGO_URI}")
+    _bootstrap_config()
+    
+    print(f"\nMongoDB URI: {redact_uri(MONGO_URI)}")
     print(f"Starting server on {args.host}:{args.port}")
     print(f"SSL: {'Enabled' if args.ssl else 'Disabled'}")
     print(f"\nTest connection:")